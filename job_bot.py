@@ -1,5 +1,6 @@
 #!/usr/bin/env python3
 import os
+import re
 import sys
 import time
 import json
@@ -7,12 +8,14 @@ import asyncio
 import logging
 import sqlite3
 import traceback
-from datetime import datetime
+from datetime import datetime, timedelta
+from urllib.parse import urlencode
+import requests
+from requests.adapters import HTTPAdapter
 from dotenv import load_dotenv
 from aiogram import Bot, Dispatcher, types
 from aiogram.utils import executor
-from playwright.async_api import async_playwright
-from stealth import apply_stealth_sync  # NOTE: this is sync-only, so apply minimal stealth here or skip
+from stealth import STEALTH_JS
 
 # Load config
 load_dotenv()
@@ -26,96 +29,227 @@ MAX_DISTANCE = 5  # miles
 SCRAPE_LIMIT = 33
 SEND_LIMIT = 8
 SEND_TIMES = ["10:30", "17:30", "21:00"]
+SEND_AT = sorted(datetime.strptime(t, "%H:%M").time() for t in SEND_TIMES)
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/115.0.0.0 Safari/537.36"
 
-# Logging
+# Pooled session for scrape HTTP so repeated fetches reuse the TLS connection
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=8))
+
+JK_RE = re.compile(rb'data-jk="([^"]+)"(?:[^>]*?title="([^"]+)")?')
+SEARCH_URL = "https://uk.indeed.com/jobs?" + urlencode({"q": QUERY, "l": LOCATION, "radius": MAX_DISTANCE})
+HTTP_HEADERS = {"User-Agent": USER_AGENT, "Accept-Language": "en-GB,en;q=0.9"}
+
+# Logging - errors also go to a file handler opened once for the process
 logging.basicConfig(level=logging.INFO, format='[%(asctime)s] %(message)s')
 log = logging.getLogger()
+_err_handler = logging.FileHandler("job_bot_errors.log")
+_err_handler.setLevel(logging.ERROR)
+_err_handler.setFormatter(logging.Formatter('[%(asctime)s] %(message)s'))
+log.addHandler(_err_handler)
 
 # Bot init
 bot = Bot(token=TOKEN)
 dp = Dispatcher(bot)
 
-# DB init and helpers
+# DB init and helpers - one shared connection, opened once in init_db().
+# SENT_IDS mirrors the table so the read side never touches SQLite.
+DB = None
+SENT_IDS = set()
+
 def init_db():
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("CREATE TABLE IF NOT EXISTS sent_jobs (job_id TEXT PRIMARY KEY)")
-    conn.commit()
-    conn.close()
-
-def already_sent(job_id):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("SELECT 1 FROM sent_jobs WHERE job_id = ?", (job_id,))
-    result = c.fetchone()
-    conn.close()
-    return result is not None
-
-def mark_sent(job_id):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("INSERT OR IGNORE INTO sent_jobs (job_id) VALUES (?)", (job_id,))
-    conn.commit()
-    conn.close()
-
-# Async scraper using async_playwright
+    global DB
+    DB = sqlite3.connect(DB_PATH, check_same_thread=False, isolation_level=None,
+                         cached_statements=128)
+    # WAL + relaxed sync: one fsync per commit instead of two, no per-call open/close
+    DB.execute("PRAGMA journal_mode=WAL")
+    DB.execute("PRAGMA synchronous=NORMAL")
+    DB.execute("PRAGMA temp_store=MEMORY")
+    DB.execute("PRAGMA busy_timeout=5000")
+    # Keep the small dedup table in the mmap'd region so lookups skip the pager
+    DB.execute("PRAGMA page_size=4096")
+    DB.execute("PRAGMA mmap_size=268435456")
+    DB.execute("PRAGMA cache_size=-65536")
+    DB.execute("PRAGMA auto_vacuum=INCREMENTAL")  # only takes effect on a fresh DB
+    DB.execute("CREATE TABLE IF NOT EXISTS sent_jobs (job_id TEXT PRIMARY KEY, sent_at TEXT)")
+    # Older DBs predate the sent_at column
+    cols = [r[1] for r in DB.execute("PRAGMA table_info(sent_jobs)")]
+    if "sent_at" not in cols:
+        DB.execute("ALTER TABLE sent_jobs ADD COLUMN sent_at TEXT")
+    # Job ids stop mattering after a few weeks - expire old rows so the dedup
+    # B-tree stays tiny
+    cutoff = (datetime.now() - timedelta(days=30)).isoformat()
+    DB.execute("DELETE FROM sent_jobs WHERE sent_at IS NOT NULL AND sent_at < ?", (cutoff,))
+    DB.execute("PRAGMA incremental_vacuum(100)")
+    SENT_IDS.update(r[0] for r in DB.execute("SELECT job_id FROM sent_jobs"))
+    return DB
+
+def mark_sent_many(rows):
+    # One transaction for the whole burst so all inserts share a single fsync
+    DB.execute("BEGIN IMMEDIATE")
+    try:
+        DB.executemany("INSERT OR IGNORE INTO sent_jobs (job_id, sent_at) VALUES (?, ?)", rows)
+        DB.execute("COMMIT")
+        SENT_IDS.update(job_id for job_id, _ in rows)
+    except Exception:
+        DB.execute("ROLLBACK")
+        raise
+
+# Cookie cache - parsed and sanitized once per process, shared by both paths
+ALLOWED_SAMESITE = frozenset(("Strict", "Lax", "None"))
+_COOKIES = None
+
+def sanitize_cookie(c):
+    # Browser exports carry extra fields and sameSite spellings that
+    # context.add_cookies rejects - normalize to the Playwright shape
+    same_site = c.get("sameSite")
+    if same_site not in ALLOWED_SAMESITE:
+        same_site = "Lax"
+    return {
+        "name": c.get("name", ""),
+        "value": c.get("value", ""),
+        "domain": c.get("domain", ""),
+        "path": c.get("path", "/"),
+        "secure": bool(c.get("secure", False)),
+        "httpOnly": bool(c.get("httpOnly", False)),
+        "sameSite": same_site,
+    }
+
+def load_cookies():
+    global _COOKIES
+    if _COOKIES is None:
+        _COOKIES = []
+        if os.path.exists(COOKIES_FILE):
+            now_ts = int(time.time())
+            with open(COOKIES_FILE, "r") as f:
+                for c in json.load(f):
+                    exp = c.get("expirationDate")
+                    if exp is not None and exp < now_ts:
+                        continue  # expired - the browser would drop it anyway
+                    cookie = sanitize_cookie(c)
+                    cookie["expires"] = int(exp) if exp is not None else -1
+                    _COOKIES.append(cookie)
+    return _COOKIES
+
+# Plain-HTTP scraper - the search results page is static HTML, so one GET plus
+# a regex pass is far cheaper than spinning up headless Chromium
+def scrape_jobs_http():
+    cookies = {c["name"]: c.get("value", "") for c in load_cookies() if c.get("name")}
+    try:
+        r = SESSION.get(SEARCH_URL, headers=HTTP_HEADERS, cookies=cookies, timeout=15)
+    except Exception as e:
+        log.error(f"HTTP scrape failed: {e}")
+        return []
+    if r.status_code != 200:
+        # 403/429 means we are being challenged - let the browser path handle it
+        log.warning(f"HTTP scrape got status {r.status_code}")
+        return []
+    jobs = []
+    seen = set()
+    # Scan the raw bytes - skips the full r.text decode of a ~1MB page
+    for m in JK_RE.finditer(r.content):
+        jk = m.group(1).decode("utf-8", "replace")
+        if jk in seen:
+            continue
+        seen.add(jk)
+        title = m.group(2).decode("utf-8", "replace") if m.group(2) else "Job"
+        jobs.append((jk, title, f"https://uk.indeed.com/viewjob?jk={jk}"))
+        if len(jobs) >= SCRAPE_LIMIT:
+            break
+    return jobs
+
 async def scrape_jobs():
+    # HTTP first; fall back to the browser only when it comes back empty
+    # (likely a bot challenge)
+    jobs = await asyncio.to_thread(scrape_jobs_http)
+    if not jobs:
+        log.info("HTTP scrape empty, falling back to Playwright")
+        jobs = await scrape_jobs_pw()
+    jobs = [j for j in jobs if j[0] not in SENT_IDS]
+    return jobs[:SEND_LIMIT]
+
+# Persistent browser state - launched lazily, contexts are per-scrape
+BROWSER_ARGS = [
+    '--disable-blink-features=AutomationControlled',
+    '--no-sandbox',
+    '--disable-setuid-sandbox',
+    '--disable-dev-shm-usage',
+    '--disable-extensions',
+    '--disable-gpu',
+]
+BROWSER_RECYCLE_AFTER = 20  # relaunch every N contexts to bound Playwright leaks
+BLOCKED_RESOURCES = {"image", "media", "font", "stylesheet"}
+PW = None
+BROWSER = None
+BROWSER_CONTEXTS = 0
+
+async def get_browser():
+    global PW, BROWSER, BROWSER_CONTEXTS
+    if PW is None:
+        # Imported lazily - the HTTP path is the default and most runs never
+        # need the browser at all
+        from playwright.async_api import async_playwright
+        PW = await async_playwright().start()
+    if BROWSER is None or BROWSER_CONTEXTS >= BROWSER_RECYCLE_AFTER:
+        if BROWSER is not None:
+            await BROWSER.close()
+        BROWSER = await PW.chromium.launch(headless=True, args=BROWSER_ARGS)
+        BROWSER_CONTEXTS = 0
+    BROWSER_CONTEXTS += 1
+    return BROWSER
+
+async def close_browser(_dp):
+    # Shutdown hook - the persistent browser outlives individual scrapes
+    if BROWSER is not None:
+        await BROWSER.close()
+    if PW is not None:
+        await PW.stop()
+
+async def block_static(route):
+    # The scraper only reads HTML - drop images/fonts/media/css at the context
+    # level (one handler, unlike page.route which leaks)
+    if route.request.resource_type in BLOCKED_RESOURCES:
+        await route.abort()
+    else:
+        await route.continue_()
+
+# Async scraper using async_playwright, kept as fallback
+async def scrape_jobs_pw():
     jobs = []
     try:
-        async with async_playwright() as p:
-            browser = await p.chromium.launch(headless=True,
-                                              args=[
-                                                  '--disable-blink-features=AutomationControlled',
-                                                  '--no-sandbox',
-                                                  '--disable-setuid-sandbox',
-                                                  '--disable-dev-shm-usage',
-                                                  '--disable-extensions',
-                                                  '--disable-gpu',
-                                              ])
-            context = await browser.new_context(
-                viewport={"width": 1280, "height": 800},
-                user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/115.0.0.0 Safari/537.36",
-                locale="en-GB",
-                timezone_id="Europe/London",
-            )
+        browser = await get_browser()
+        context = await browser.new_context(
+            viewport={"width": 1280, "height": 800},
+            user_agent=USER_AGENT,
+            locale="en-GB",
+            timezone_id="Europe/London",
+        )
+        try:
+            await context.route("**/*", block_static)
+            await context.add_init_script(STEALTH_JS)
 
             # Load cookies if available
-            if os.path.exists(COOKIES_FILE):
-                with open(COOKIES_FILE, "r") as f:
-                    cookies = json.load(f)
-                    await context.add_cookies(cookies)
+            cookies = load_cookies()
+            if cookies:
+                await context.add_cookies(cookies)
 
             page = await context.new_page()
 
-            # Minimal stealth - your `apply_stealth_sync` is sync-only and incompatible here
-            # You may skip or manually patch properties like below:
-            await page.add_init_script("""
-                Object.defineProperty(navigator, 'webdriver', {get: () => undefined});
-                window.chrome = { runtime: {} };
-                Object.defineProperty(navigator, 'languages', {get: () => ['en-GB', 'en']});
-                Object.defineProperty(navigator, 'plugins', {get: () => [1, 2, 3, 4, 5]});
-            """)
-
-            url = f"https://uk.indeed.com/jobs?q={QUERY.replace(' ', '+')}&l={LOCATION}&radius={MAX_DISTANCE}"
-            log.info(f"Loading Indeed search: {url}")
-            await page.goto(url, timeout=30000)
+            log.info(f"Loading Indeed search: {SEARCH_URL}")
+            await page.goto(SEARCH_URL, timeout=30000)
 
             await page.wait_for_selector("a[data-jk]", timeout=10000)
-            job_elements = await page.query_selector_all("a[data-jk]")
-            job_elements = job_elements[:SCRAPE_LIMIT]
-
-            for el in job_elements:
-                try:
-                    jk = await el.get_attribute("data-jk")
-                    title = (await el.inner_text()).strip()
-                    href = f"https://uk.indeed.com/viewjob?jk={jk}"
-                    if not already_sent(jk):
-                        jobs.append((jk, title, href))
-                except Exception:
-                    continue
-
-            await browser.close()
-            return jobs[:SEND_LIMIT]
+            # One evaluate returns every (jk, title) pair in a single CDP call
+            # instead of 2 round trips per element
+            rows = await page.evaluate(
+                "() => Array.from(document.querySelectorAll('a[data-jk]'))"
+                ".map(a => ({jk: a.dataset.jk, title: a.innerText.trim()}))"
+            )
+            for row in rows[:SCRAPE_LIMIT]:
+                jobs.append((row["jk"], row["title"], f"https://uk.indeed.com/viewjob?jk={row['jk']}"))
+        finally:
+            await context.close()
+        return jobs
     except Exception as e:
         log.error(f"Scraping failed: {e}")
         return []
@@ -125,7 +259,7 @@ async def scrape_jobs():
 async def handle_test(msg: types.Message):
     jobs = await scrape_jobs()
     if jobs:
-        await send_job(jobs[0])
+        await send_jobs(jobs[:1])
     else:
         await msg.reply("No jobs found.")
 
@@ -147,18 +281,50 @@ async def send_job(job):
     markup.add(types.InlineKeyboardButton("✅ Accept", callback_data=f"accept_{jk}"))
     markup.add(types.InlineKeyboardButton("❌ Decline", callback_data=f"decline_{jk}"))
     await bot.send_message(CHAT_ID, text, reply_markup=markup, parse_mode="HTML")
-    mark_sent(jk)
+
+SEND_CONCURRENCY = 4  # concurrent sends, kept under Telegram's rate limit
+
+async def send_jobs(jobs):
+    # Steady state is "same jobs as last cycle" - everything already filtered
+    # out by SENT_IDS, so bail before touching the DB or Telegram
+    if not jobs:
+        log.info("No new jobs to send")
+        return 0
+    sem = asyncio.Semaphore(SEND_CONCURRENCY)
+    sent_at = datetime.now().isoformat()  # one timestamp for the whole batch
+
+    async def send_one(job):
+        async with sem:
+            await send_job(job)
+            return (job[0], sent_at)
+
+    results = await asyncio.gather(*(send_one(j) for j in jobs), return_exceptions=True)
+    rows = []
+    for job, result in zip(jobs, results):
+        if isinstance(result, Exception):
+            log.error(f"Send failed for {job[0]}: {result}")
+        else:
+            rows.append(result)
+    if rows:
+        await asyncio.to_thread(mark_sent_many, rows)
+    return len(rows)
+
+def seconds_until_next_send(now=None):
+    now = now or datetime.now()
+    for t in SEND_AT:
+        candidate = datetime.combine(now.date(), t)
+        if candidate > now:
+            return (candidate - now).total_seconds()
+    # All of today's slots have passed - first slot tomorrow
+    first = datetime.combine(now.date() + timedelta(days=1), SEND_AT[0])
+    return (first - now).total_seconds()
 
 async def scheduled_send():
     while True:
-        now = datetime.now().strftime("%H:%M")
-        if now in SEND_TIMES:
-            log.info(f"Scheduled send at {now}")
-            jobs = await scrape_jobs()
-            for job in jobs:
-                await send_job(job)
-            await asyncio.sleep(60)  # avoid duplicate sends in the same minute
-        await asyncio.sleep(20)
+        await asyncio.sleep(seconds_until_next_send())
+        log.info("Scheduled send")
+        jobs = await scrape_jobs()
+        await send_jobs(jobs)
 
 # Main
 if __name__ == "__main__":
@@ -170,7 +336,8 @@ if __name__ == "__main__":
         init_db()
         loop = asyncio.get_event_loop()
         loop.create_task(scheduled_send())
-        executor.start_polling(dp, skip_updates=True)
+        # 50s server-side long poll: one idle getUpdates per ~50s instead of per 20s
+        executor.start_polling(dp, skip_updates=True, timeout=50, on_shutdown=close_browser)
     except Exception:
         log.error(traceback.format_exc())
         sys.exit(1)
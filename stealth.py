@@ -1,17 +1,22 @@
 # stealth.py
 
-def apply_stealth_sync(page):
-    # Apply stealth tricks to a Playwright sync page object to evade detection
-    page.add_init_script("""
-        Object.defineProperty(navigator, 'webdriver', {get: () => undefined});
-        window.chrome = { runtime: {} };
-        Object.defineProperty(navigator, 'languages', {get: () => ['en-GB', 'en']});
-        Object.defineProperty(navigator, 'plugins', {get: () => [1, 2, 3, 4, 5]});
-        // Mock the permissions API
-        const originalQuery = window.navigator.permissions.query;
-        window.navigator.permissions.query = (parameters) => (
-            parameters.name === 'notifications' ?
-                Promise.resolve({ state: Notification.permission }) :
-                originalQuery(parameters)
-        );
-    """)
+# Stealth tricks to evade detection, kept as one module-level constant so the
+# script string is allocated once and shared by every caller
+STEALTH_JS = """
+    Object.defineProperty(navigator, 'webdriver', {get: () => undefined});
+    window.chrome = { runtime: {} };
+    Object.defineProperty(navigator, 'languages', {get: () => ['en-GB', 'en']});
+    Object.defineProperty(navigator, 'plugins', {get: () => [1, 2, 3, 4, 5]});
+    // Mock the permissions API
+    const originalQuery = window.navigator.permissions.query;
+    window.navigator.permissions.query = (parameters) => (
+        parameters.name === 'notifications' ?
+            Promise.resolve({ state: Notification.permission }) :
+            originalQuery(parameters)
+    );
+"""
+
+def apply_stealth_sync(context):
+    # Attach at the BrowserContext so the script is compiled once per context
+    # and inherited by every page and frame
+    context.add_init_script(STEALTH_JS)